@@ -8,43 +8,221 @@ Includes auto-recovery webhook system and health monitoring.
 """
 
 import os
+import atexit
 import datetime
+import logging
+import logging.handlers
+import queue
+import sys
 import requests
-import pytz
 import threading
 import telegram
 import time
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from zoneinfo import ZoneInfo
 from flask import Flask, request
-from telegram.ext import Updater, CommandHandler
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from telegram.utils.helpers import escape_markdown
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.base import JobLookupError
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, DeleteOne
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+from pymongo.server_api import ServerApi
+
+# orjson decodes JSON in native code; fall back to the stdlib parser if absent.
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# ciso8601 parses ISO 8601 timestamps in C; fall back to the stdlib parser if absent.
+try:
+    from ciso8601 import parse_datetime as parse_utc_date
+except ImportError:
+    if sys.version_info >= (3, 11):
+        # fromisoformat accepts the trailing "Z" since Python 3.11
+        parse_utc_date = datetime.datetime.fromisoformat
+    else:
+        def parse_utc_date(value):
+            return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+__all__ = [
+    "app",
+    "israel_tz",
+    "get_opponent",
+    "fetch_game_schedule",
+    "fetch_standings",
+    "schedule_reminders",
+    "update_schedule",
+    "send_reminder",
+    "register_chat",
+    "remove_chat",
+    "start",
+    "remove",
+    "league",
+    "championsLeague",
+    "main",
+]
 
 # Load environment variables from .env
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Retrieve credentials and configuration
 TELEGRAM_TOKEN = os.environ.get('TELEGRAM_TOKEN')
 FOOTBALL_API_KEY = os.environ.get('FOOTBALL_API_KEY')
 PORT = int(os.environ.get('PORT', 8080))
 MONGODB_URI = os.environ.get('MONGODB_URI')
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL')
+ON_RENDER = bool(os.environ.get('RENDER'))
+
+# Dispatcher threads that run command handlers concurrently
+HANDLER_WORKERS = 8
+
+# Connections to the Telegram Bot API: one per concurrent sender (reminder fan-out
+# and handlers) plus a few for the webhook/polling machinery
+TELEGRAM_POOL_SIZE = 30
+
+# Production WSGI server: worker threads and open connections it accepts.
+# The webhook view decodes the update and lets the started dispatcher hand commands
+# to its HANDLER_WORKERS threads (extra commands wait in the dispatcher's queue),
+# so each request takes a thread only briefly and a few threads serve many connections.
+WSGI_THREADS = 8
+WSGI_CONNECTION_LIMIT = 128
 
-# Connect to MongoDB and use the "fcbarca_bot" database
-mongo_client = MongoClient(MONGODB_URI)
+# Seconds Telegram keeps a getUpdates long-poll open in development mode
+POLL_TIMEOUT = 30
+
+# Connect to MongoDB and use the "fcbarca_bot" database.
+# The bot is idle most of the time with short bursts of registrations, so keep a
+# small warm pool (one client per process) instead of the driver's default of 100.
+mongo_client = MongoClient(
+    MONGODB_URI,
+    appname="fcbarca_bot",
+    server_api=ServerApi("1"),
+    # zstd when installed (pymongo[zstd]), otherwise the built-in zlib
+    compressors="zstd,zlib",
+    zlibCompressionLevel=3,
+    maxPoolSize=10,
+    minPoolSize=2,
+    maxIdleTimeMS=300000,
+    waitQueueTimeoutMS=5000,
+    serverSelectionTimeoutMS=5000,
+    retryWrites=True,
+    w="majority"
+)
+atexit.register(mongo_client.close)
 db = mongo_client["fcbarca_bot"]
 chats_collection = db.registered_chats
 
+# Documents fetched per round-trip when reading all registered chats
+CHATS_BATCH_SIZE = 500
+
+# In-process cache of registered chat IDs (None until first loaded), so reminders
+# don't query MongoDB; kept in sync by register_chat/remove_chat and watch_chats
+_chat_ids = None
+_chat_ids_lock = threading.Lock()
+
+# Server errors meaning change streams aren't available at all (standalone server or
+# no $changeStream support); any other error is retried
+CHANGE_STREAM_UNSUPPORTED_CODES = {40573, 40324, 115}
+
+# Chat registrations/removals are queued briefly and written in one bulk_write,
+# keyed by chat ID so only the latest operation per chat is sent
+CHAT_WRITE_DELAY = 0.05  # seconds
+CHAT_WRITE_MAX_BATCH = 500
+CHAT_WRITE_RETRY_DELAY = 5  # seconds before resending a failed bulk write
+_pending_chat_writes = {}
+_chat_writes_lock = threading.Lock()
+_chat_write_timer = None
+
 # Football-Data.org v4 endpoints
 FOOTBALL_API_URL = "http://api.football-data.org/v4/teams/81/matches?status=SCHEDULED"
 LEAGUE_STANDINGS_URL = "http://api.football-data.org/v4/competitions/PD/standings"
 CHAMPIONS_LEAGUE_STANDINGS_URL = "http://api.football-data.org/v4/competitions/CL/standings"
 
+# Shared HTTP session for Football-Data.org: keeps connections alive between calls
+# and retries transient failures (rate limiting, server errors) with backoff.
+# Connect timeout slightly above a multiple of 3s (the default TCP packet
+# retransmission window), as recommended by the requests documentation
+HTTP_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+_http = requests.Session()
+_http.headers.update({"X-Auth-Token": FOOTBALL_API_KEY or ""})
+_http_adapter = HTTPAdapter(
+    pool_connections=2,
+    pool_maxsize=8,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,
+    ),
+)
+_http.mount("http://", _http_adapter)
+_http.mount("https://", _http_adapter)
+
+# Cached match schedule and the validators needed for conditional requests
+SCHEDULE_CACHE_TTL = 600  # seconds
+SCHEDULE_WINDOW_DAYS = 60  # how far ahead to request scheduled matches
+_sched_cache = {"etag": None, "last_modified": None, "matches": [], "params": None, "fetched": 0}
+
+# Rendered standings messages keyed by URL; standings only change after matches
+STANDINGS_CACHE_TTL = 300  # seconds
+_standings_cache = {}
+
+# Reminder fan-out: Telegram calls are I/O-bound, so several run in parallel,
+# rate limited to stay under Telegram's global limit of ~30 messages per second.
+SEND_WORKERS = 16
+SEND_RATE_LIMIT = 30  # messages per second
+_send_pool = ThreadPoolExecutor(max_workers=SEND_WORKERS)
+# Reminder jobs hand their broadcast to this single thread, which works through them in order
+_broadcast_pool = ThreadPoolExecutor(max_workers=1)
+_send_lock = threading.Lock()
+_send_tokens = float(SEND_RATE_LIMIT)
+_tokens_updated_at = time.monotonic()
+
+# Webhook registration: only message updates are delivered to the bot
+WEBHOOK_ALLOWED_UPDATES = ["message"]
+# Telegram may open this many parallel HTTPS connections; stays below WSGI_CONNECTION_LIMIT
+WEBHOOK_MAX_CONNECTIONS = 100
+
+# An hourly job on Render checks and restores the webhook registration. An update
+# that fails to process also triggers a check, at most once per cooldown.
+WEBHOOK_FAILURE_CHECK_COOLDOWN = 60  # seconds
+WEBHOOK_SAFETY_CHECK_HOURS = 1
+_last_webhook_check = 0.0
+_webhook_check_lock = threading.Lock()
+
+# Threads APScheduler uses to run jobs
+SCHEDULER_WORKERS = 4
+
+# Hours before kick-off at which reminders are sent
+REMINDER_HOURS = (7, 5, 2)
+REMINDER_DELTAS = tuple(datetime.timedelta(hours=h) for h in REMINDER_HOURS)
+REMINDER_MISFIRE_GRACE = 3600  # seconds a reminder may still run after its time
+
+# Match reminder job IDs share this prefix so they can be told apart from
+# long-lived jobs such as "daily_update" and "webhook_health"
+REMINDER_JOB_PREFIX = "match:"
+
 # Define Israel timezone
-israel_tz = pytz.timezone("Asia/Jerusalem")
+israel_tz = ZoneInfo("Asia/Jerusalem")
 
 # Initialize Flask app
 app = Flask(__name__)
 
+def redact_token(url):
+    """
+    Hides the bot token (part of the webhook path) before a URL is logged.
+    """
+    if url and TELEGRAM_TOKEN:
+        return url.replace(TELEGRAM_TOKEN, "<token>")
+    return url
+
 def check_webhook_health():
     """
     Checks if the webhook is working by getting webhook info from Telegram.
@@ -52,143 +230,438 @@ def check_webhook_health():
     """
     try:
         webhook_info = bot.get_webhook_info()
-        webhook_url = os.environ.get('WEBHOOK_URL')
-        expected_webhook_url = f"{webhook_url}/{TELEGRAM_TOKEN}"
+        expected_webhook_url = f"{WEBHOOK_URL}/{TELEGRAM_TOKEN}"
         
         # Check if webhook is set and matches our expected URL
         if webhook_info.url == expected_webhook_url:
             return True
-        print(f"Webhook mismatch. Expected: {expected_webhook_url}, Got: {webhook_info.url}")
+        logger.warning(
+            "Webhook mismatch. Expected: %s, Got: %s",
+            redact_token(expected_webhook_url), redact_token(webhook_info.url)
+        )
         return False
     except Exception as e:
-        print(f"Error checking webhook health: {e}")
+        logger.error("Error checking webhook health: %s", e)
         return False
 
+def set_webhook(full_webhook_url):
+    """
+    Registers the webhook with Telegram, subscribing only to the update types the bot handles.
+    """
+    bot.set_webhook(
+        url=full_webhook_url,
+        allowed_updates=WEBHOOK_ALLOWED_UPDATES,
+        max_connections=WEBHOOK_MAX_CONNECTIONS
+    )
+
 def restore_webhook():
     """
     Attempts to restore the webhook configuration.
     """
     try:
-        webhook_url = os.environ.get('WEBHOOK_URL')
-        if webhook_url:
-            full_webhook_url = f"{webhook_url}/{TELEGRAM_TOKEN}"
-            bot.set_webhook(full_webhook_url)
-            print(f"Restored webhook to: {full_webhook_url}")
+        if WEBHOOK_URL:
+            full_webhook_url = f"{WEBHOOK_URL}/{TELEGRAM_TOKEN}"
+            set_webhook(full_webhook_url)
+            logger.info("Restored webhook to: %s", redact_token(full_webhook_url))
             return True
     except Exception as e:
-        print(f"Error restoring webhook: {e}")
+        logger.error("Error restoring webhook: %s", e)
     return False
 
-def webhook_monitor():
+def ensure_webhook():
     """
-    Background task that monitors webhook health and restores it if needed.
+    Checks webhook health and restores it if needed.
+    Run by the hourly job on Render instead of polling Telegram every minute,
+    and after a webhook update fails to process.
     """
-    while True:
-        if os.environ.get('RENDER') and not check_webhook_health():
-            print("Webhook appears to be down, attempting to restore...")
-            restore_webhook()
-        time.sleep(60)  # Check every minute
+    if ON_RENDER and not check_webhook_health():
+        logger.warning("Webhook appears to be down, attempting to restore...")
+        restore_webhook()
+
+def get_match_sides(match):
+    """
+    Returns (opponent name, whether FC Barcelona plays at home) for a match.
+    Assumes FC Barcelona's team ID is 81.
+    """
+    try:
+        home = match['homeTeam']
+        is_home = home['id'] == 81
+        opponent = match['awayTeam']['name'] if is_home else home['name']
+    except KeyError:
+        return 'Unknown Opponent', False
+    return opponent or 'Unknown Opponent', is_home
 
 def get_opponent(match):
     """
     Determines the opponent's name from the match data.
     Assumes FC Barcelona's team ID is 81.
     """
-    if match.get('homeTeam', {}).get('id') == 81:
-        return match.get('awayTeam', {}).get('name', 'Unknown Opponent')
-    else:
-        return match.get('homeTeam', {}).get('name', 'Unknown Opponent')
+    return get_match_sides(match)[0]
 
 def fetch_game_schedule():
     """
-    Fetches scheduled matches for FC Barcelona from Football-Data.org (v4).
-    Converts the UTC match time to an aware datetime in Israel time.
+    Fetches scheduled matches for FC Barcelona from Football-Data.org (v4)
+    for the next SCHEDULE_WINDOW_DAYS days.
+    Converts the UTC match time to an aware datetime in Israel time, tags each
+    match with compKind ("champions" or "league") and sorts matches by kick-off.
+
+    The parsed match list is cached: calls within SCHEDULE_CACHE_TTL seconds skip
+    the API entirely, and later calls send a conditional GET so an unchanged
+    schedule (HTTP 304) is served from the cache without re-parsing. If the request
+    fails or the API returns an error, the last fetched schedule is returned, so
+    callers don't take a failed request for a schedule without matches.
     """
-    headers = {"X-Auth-Token": FOOTBALL_API_KEY}
-    response = requests.get(FOOTBALL_API_URL, headers=headers)
+    if _sched_cache["fetched"] and time.monotonic() - _sched_cache["fetched"] < SCHEDULE_CACHE_TTL:
+        return _sched_cache["matches"]
+
+    # Only ask for the matches inside the sliding window; the window moves daily.
+    today = datetime.datetime.now(israel_tz).date()
+    params = {
+        "dateFrom": today.isoformat(),
+        "dateTo": (today + datetime.timedelta(days=SCHEDULE_WINDOW_DAYS)).isoformat(),
+    }
+    headers = {}
+    # Validators only apply to the window they were issued for
+    if _sched_cache["params"] == params:
+        if _sched_cache["etag"]:
+            headers["If-None-Match"] = _sched_cache["etag"]
+        if _sched_cache["last_modified"]:
+            headers["If-Modified-Since"] = _sched_cache["last_modified"]
+    try:
+        response = _http.get(FOOTBALL_API_URL, params=params, headers=headers, timeout=HTTP_TIMEOUT)
+    except requests.RequestException as e:
+        logger.error("Error fetching match schedule: %s", e)
+        return _sched_cache["matches"]
+    if response.status_code == 304:
+        _sched_cache["fetched"] = time.monotonic()
+        return _sched_cache["matches"]
     if response.status_code == 200:
-        data = response.json()
+        try:
+            data = json_loads(response.content)
+        except ValueError as e:
+            logger.error("Invalid match schedule response: %s", e)
+            return _sched_cache["matches"]
         matches = data.get("matches", [])
+        # Bind the per-match helpers to locals once for the loop
+        parse, local_tz = parse_utc_date, israel_tz
         for match in matches:
-            utc_dt = datetime.datetime.fromisoformat(match['utcDate'].replace("Z", "+00:00"))
-            match['localDate'] = utc_dt.astimezone(israel_tz)
+            match['localDate'] = parse(match['utcDate']).astimezone(local_tz)
+            # Classify once per fetch; anything that isn't the Champions League counts as league
+            comp_name = match.get('competition', {}).get('name', '').lower()
+            match['compKind'] = 'champions' if 'champions' in comp_name else 'league'
+        # Keep the list in kick-off order so callers can stop at the end of their window
+        matches.sort(key=itemgetter('localDate'))
+        _sched_cache.update(
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            matches=matches,
+            params=params,
+            fetched=time.monotonic(),
+        )
         return matches
     else:
-        print("Error fetching match schedule:", response.status_code, response.text)
-        return []
+        logger.error("Error fetching match schedule: %s %s", response.status_code, response.text)
+        return _sched_cache["matches"]
 
-def send_reminder(bot, game_time, hours_before, opponent, home_away):
+def wait_for_send_slot():
     """
-    Sends a reminder message via the Telegram bot to all registered chats.
+    Blocks until a send token is available (token bucket of SEND_RATE_LIMIT tokens,
+    refilled at SEND_RATE_LIMIT per second). Up to a second's worth of messages go
+    out immediately; larger broadcasts are throttled to the refill rate.
     """
-    message = (
-        f"Reminder: FC Barcelona {home_away} match against {opponent} at "
-        f"{game_time.strftime('%Y-%m-%d %H:%M %Z')} in {hours_before} hours!"
-    )
-    for chat in chats_collection.find():
-        chat_id = chat['chat_id']
+    global _send_tokens, _tokens_updated_at
+    while True:
+        with _send_lock:
+            now = time.monotonic()
+            elapsed = now - _tokens_updated_at
+            _send_tokens = min(SEND_RATE_LIMIT, _send_tokens + elapsed * SEND_RATE_LIMIT)
+            _tokens_updated_at = now
+            if _send_tokens >= 1:
+                _send_tokens -= 1
+                return
+            wait = (1 - _send_tokens) / SEND_RATE_LIMIT
+        time.sleep(wait)
+
+def safe_send(bot, chat_id, message):
+    """
+    Sends a message to a single chat, honouring Telegram's flood control.
+    Errors are logged rather than raised so one bad chat doesn't stop the fan-out.
+    """
+    wait_for_send_slot()
+    try:
+        bot.send_message(chat_id=chat_id, text=message)
+    except telegram.error.RetryAfter as e:
+        # Telegram asked us to back off; wait as instructed and try once more.
+        time.sleep(e.retry_after)
         try:
             bot.send_message(chat_id=chat_id, text=message)
         except Exception as e:
-            print(f"Error sending reminder to chat {chat_id}: {e}")
-    print(f"Sent {hours_before}h reminder for game at {game_time} against {opponent} ({home_away}).")
+            logger.error("Error sending reminder to chat %s: %s", chat_id, e)
+    except Exception as e:
+        logger.error("Error sending reminder to chat %s: %s", chat_id, e)
+
+def broadcast(bot, text):
+    """
+    Sends a pre-formatted reminder message to all registered chats.
+    Messages are sent in parallel on the shared send pool.
+    """
+    try:
+        chat_ids = get_chat_ids()
+        list(_send_pool.map(lambda chat_id: safe_send(bot, chat_id, text), chat_ids))
+        logger.info("Sent reminder to %d chat(s): %s", len(chat_ids), text)
+    except Exception:
+        logger.exception("Error broadcasting reminder: %s", text)
+
+def send_reminder(bot, text):
+    """
+    Queues a reminder broadcast and returns its Future without waiting for it.
+    Broadcasts run one at a time on a dedicated thread, so overlapping reminders share
+    the rate limit in order and the scheduler job finishes immediately.
+    """
+    return _broadcast_pool.submit(broadcast, bot, text)
 
 def schedule_reminders(bot, scheduler):
     """
     Fetches the match schedule and schedules reminder jobs for each match.
     Reminders are set for 7, 5, and 2 hours before each match.
+    Reminders that are already scheduled with the same message are left untouched.
+    Returns the set of reminder job IDs that belong to the current schedule.
     """
     matches = fetch_game_schedule()
     now = datetime.datetime.now(israel_tz)
+    existing = {job.id: job for job in scheduler.get_jobs() if job.id.startswith(REMINDER_JOB_PREFIX)}
+    current_ids = set()
     for match in matches:
         game_time = match['localDate']
-        opponent = get_opponent(match)
-        # Determine home or away based on FC Barcelona's team ID (81)
-        is_home = match.get('homeTeam', {}).get('id') == 81
+        opponent, is_home = get_match_sides(match)
         home_away = "Home" if is_home else "Away"
         if game_time > now:
-            for hours in [7, 5, 2]:
-                reminder_time = game_time - datetime.timedelta(hours=hours)
+            kickoff = game_time.strftime('%Y-%m-%d %H:%M %Z')
+            for hours, delta in zip(REMINDER_HOURS, REMINDER_DELTAS):
+                reminder_time = game_time - delta
                 if reminder_time > now:
-                    job_id = f"{game_time.isoformat()}_{hours}"
+                    job_id = f"{REMINDER_JOB_PREFIX}{game_time.isoformat()}:{hours}"
+                    current_ids.add(job_id)
+                    message = (
+                        f"Reminder: FC Barcelona {home_away} match against {opponent} at "
+                        f"{kickoff} in {hours} hours!"
+                    )
+                    job = existing.get(job_id)
+                    if job is not None and job.args[1] == message:
+                        continue
                     scheduler.add_job(
                         send_reminder,
                         'date',
                         run_date=reminder_time,
-                        args=[bot, game_time, hours, opponent, home_away],
-                        id=job_id
+                        args=[bot, message],
+                        id=job_id,
+                        replace_existing=True,
+                        # Still send the reminder if the scheduler thread runs it late
+                        # (e.g. all executor threads busy). Jobs live in memory only, so
+                        # this doesn't recover reminders missed while the bot was down.
+                        misfire_grace_time=REMINDER_MISFIRE_GRACE
                     )
-                    print(f"Scheduled {hours}h reminder for game at {game_time} against {opponent} ({home_away}) (runs at {reminder_time}).")
+                    logger.debug(
+                        "Scheduled %sh reminder for game at %s against %s (%s) (runs at %s).",
+                        hours, game_time, opponent, home_away, reminder_time
+                    )
+    return current_ids
 
 def update_schedule(bot, scheduler):
     """
-    Clears all scheduled jobs and re-fetches the match schedule to update reminders.
+    Re-fetches the match schedule and updates reminders in place: new matches are
+    scheduled and reminders for matches no longer in the schedule are removed.
     This job runs daily at 00:00 Israel time.
     """
-    print("Updating match schedule...")
-    scheduler.remove_all_jobs()
-    schedule_reminders(bot, scheduler)
-    print("Schedule updated.")
+    logger.info("Updating match schedule...")
+    # Bypass the TTL so the daily update always revalidates with Football-Data.org
+    _sched_cache["fetched"] = 0
+    previous_ids = {job.id for job in scheduler.get_jobs() if job.id.startswith(REMINDER_JOB_PREFIX)}
+    current_ids = schedule_reminders(bot, scheduler)
+    for job_id in previous_ids - current_ids:
+        try:
+            scheduler.remove_job(job_id)
+            logger.debug("Removed stale reminder job %s.", job_id)
+        except JobLookupError:
+            # The reminder fired (and was discarded) while we were updating.
+            pass
+    logger.info("Schedule updated.")
+
+def load_chat_ids():
+    """
+    Loads all registered chat IDs from MongoDB into the in-process cache.
+    """
+    global _chat_ids
+    # Only project chat_id and drain the cursor in one go
+    cursor = chats_collection.find({}, projection={"chat_id": 1, "_id": 0}).batch_size(CHATS_BATCH_SIZE)
+    chat_ids = {chat['chat_id'] for chat in cursor}
+    with _chat_ids_lock:
+        _chat_ids = chat_ids
+    return chat_ids
+
+def get_chat_ids():
+    """
+    Returns a snapshot list of the registered chat IDs, loading the cache on first use.
+    """
+    with _chat_ids_lock:
+        if _chat_ids is not None:
+            return list(_chat_ids)
+    return list(load_chat_ids())
+
+def watch_chats():
+    """
+    Background task that keeps the chat ID cache in sync with changes made by other
+    processes, using a MongoDB change stream. Inserts carry the new document, so its
+    chat ID is added directly. Delete events only carry the document's _id, so a burst
+    of deletes (e.g. one bulk write) reloads the set of chat IDs once.
+    Change streams need a replica set (e.g. MongoDB Atlas); on a standalone server the
+    watcher stops and the cache is kept up to date by register_chat/remove_chat only.
+    """
+    pipeline = [{"$match": {"operationType": {"$in": ["insert", "delete"]}}}]
+    while True:
+        try:
+            with chats_collection.watch(pipeline) as stream:
+                while stream.alive:
+                    change = stream.next()
+                    reload = False
+                    # Drain the changes that are already available before reloading
+                    while change is not None:
+                        if change["operationType"] == "insert":
+                            with _chat_ids_lock:
+                                if _chat_ids is not None:
+                                    _chat_ids.add(change["fullDocument"]["chat_id"])
+                        else:
+                            reload = True
+                        change = stream.try_next()
+                    if reload:
+                        load_chat_ids()
+        except PyMongoError as e:
+            if isinstance(e, OperationFailure) and e.code in CHANGE_STREAM_UNSUPPORTED_CODES:
+                logger.warning("Chat change stream unavailable, not watching for changes: %s", e)
+                return
+            logger.error("Chat change stream interrupted, reconnecting: %s", e)
+            time.sleep(5)
+            try:
+                # Changes may have been missed while disconnected
+                load_chat_ids()
+            except PyMongoError:
+                pass
+
+def remove_duplicate_chats():
+    """
+    Deletes all but one document per chat_id. Collections written by the earlier
+    find_one + insert_one registration may contain duplicates, which would block
+    the unique index. Returns the number of documents deleted.
+    """
+    duplicates = chats_collection.aggregate([
+        {"$group": {"_id": "$chat_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ])
+    extra_ids = [doc_id for group in duplicates for doc_id in group["ids"][1:]]
+    if extra_ids:
+        chats_collection.delete_many({"_id": {"$in": extra_ids}})
+    return len(extra_ids)
+
+def create_indexes():
+    """
+    Ensures the unique index on chat_id exists so registration can be a single upsert.
+    If duplicate chat IDs block the index, they are removed first.
+    """
+    try:
+        chats_collection.create_index("chat_id", unique=True)
+    except DuplicateKeyError:
+        removed = remove_duplicate_chats()
+        logger.warning("Removed %d duplicate chat registration(s) before indexing chat_id.", removed)
+        chats_collection.create_index("chat_id", unique=True)
+
+def queue_chat_write(chat_id, operation):
+    """
+    Queues a write for a chat ID to be sent in the next bulk write. Only the latest
+    operation per chat is kept, so a register followed by a remove collapses to one op.
+    The queue is flushed CHAT_WRITE_DELAY seconds after the first queued write, or at
+    once when it reaches CHAT_WRITE_MAX_BATCH operations.
+    """
+    with _chat_writes_lock:
+        _pending_chat_writes[chat_id] = operation
+        flush_now = len(_pending_chat_writes) >= CHAT_WRITE_MAX_BATCH
+        if not flush_now:
+            schedule_chat_flush(CHAT_WRITE_DELAY)
+    if flush_now:
+        flush_chat_writes()
+
+def schedule_chat_flush(delay):
+    """
+    Starts the flush timer unless one is already pending. Call with _chat_writes_lock held.
+    """
+    global _chat_write_timer
+    if _chat_write_timer is None:
+        _chat_write_timer = threading.Timer(delay, flush_chat_writes)
+        _chat_write_timer.daemon = True
+        _chat_write_timer.start()
+
+def flush_chat_writes():
+    """
+    Sends all queued chat registrations and removals to MongoDB in one bulk write.
+    If the write fails, the operations are queued again (unless a newer operation
+    for the same chat replaced them) and retried after CHAT_WRITE_RETRY_DELAY seconds,
+    so the chat ID cache and the database don't drift apart.
+    """
+    global _chat_write_timer
+    with _chat_writes_lock:
+        pending = dict(_pending_chat_writes)
+        _pending_chat_writes.clear()
+        if _chat_write_timer is not None:
+            _chat_write_timer.cancel()
+            _chat_write_timer = None
+    if not pending:
+        return
+    try:
+        # Each chat appears at most once, so the operations are independent
+        chats_collection.bulk_write(list(pending.values()), ordered=False)
+        logger.debug("Saved %d chat registration change(s).", len(pending))
+    except PyMongoError:
+        logger.exception("Error saving %d chat registration change(s), retrying", len(pending))
+        # Upserts and deletes are idempotent, so the whole batch can be resent
+        with _chat_writes_lock:
+            for chat_id, operation in pending.items():
+                _pending_chat_writes.setdefault(chat_id, operation)
+            schedule_chat_flush(CHAT_WRITE_RETRY_DELAY)
 
 def register_chat(chat_id):
     """
     Registers a chat ID in the MongoDB database if it's not already registered.
+    The upsert (backed by the unique chat_id index) is batched with other writes.
     """
-    if chats_collection.find_one({"chat_id": chat_id}) is None:
-        chats_collection.insert_one({"chat_id": chat_id})
-        print(f"Registered new chat: {chat_id}")
+    if _chat_ids is None:
+        get_chat_ids()
+    with _chat_ids_lock:
+        is_new = chat_id not in _chat_ids
+        _chat_ids.add(chat_id)
+    queue_chat_write(chat_id, UpdateOne(
+        {"chat_id": chat_id},
+        {"$setOnInsert": {"chat_id": chat_id}},
+        upsert=True
+    ))
+    if is_new:
+        logger.info("Registered new chat: %s", chat_id)
     else:
-        print(f"Chat {chat_id} already registered.")
+        logger.debug("Chat %s already registered.", chat_id)
 
 def remove_chat(chat_id):
     """
     Removes a chat ID from the MongoDB database.
+    The delete is batched with other writes.
     """
-    if chats_collection.find_one({"chat_id": chat_id}) is not None:
-        chats_collection.delete_one({"chat_id": chat_id})
-        print(f"Removed chat: {chat_id}")
+    if _chat_ids is None:
+        get_chat_ids()
+    with _chat_ids_lock:
+        was_registered = chat_id in _chat_ids
+        _chat_ids.discard(chat_id)
+    queue_chat_write(chat_id, DeleteOne({"chat_id": chat_id}))
+    if was_registered:
+        logger.info("Removed chat: %s", chat_id)
     else:
-        print(f"Chat {chat_id} was not registered.")
+        logger.debug("Chat %s was not registered.", chat_id)
 
 def start(update, context):
     """
@@ -206,36 +679,34 @@ def start(update, context):
     league_games = []
     champions_games = []
     
+    # Single pass over the kick-off-ordered schedule: skip past matches and stop
+    # at the first match beyond the coming week, before formatting anything
     for match in matches:
         game_time = match.get("localDate")
-        if game_time and now <= game_time <= week_later:
-            comp_name = match.get("competition", {}).get("name", "").lower()
-            opponent = get_opponent(match)
-            # Determine if it's a home or away game based on FC Barcelona's team ID (81)
-            is_home = match.get('homeTeam', {}).get('id') == 81
-            home_away = "Home" if is_home else "Away"
-            match_info = f"{game_time.strftime('%Y-%m-%d %H:%M %Z')} - vs {opponent} ({home_away})"
-            
-            if "champions" in comp_name:
-                champions_games.append(match_info)
-            elif "liga" in comp_name:
-                league_games.append(match_info)
-            else:
-                league_games.append(match_info)  # default to league if unrecognized
-            
-    welcome = (
+        if not game_time or game_time < now:
+            continue
+        if game_time > week_later:
+            break
+        opponent, is_home = get_match_sides(match)
+        match_info = f"{game_time.strftime('%Y-%m-%d %H:%M %Z')} - vs {opponent} ({'Home' if is_home else 'Away'})"
+        if match["compKind"] == "champions":
+            champions_games.append(match_info)
+        else:
+            league_games.append(match_info)
+    
+    parts = [
         "You have been registered for FC Barcelona reminders!\n"
         "This bot will remind you 7, 5, and 2 hours before each FC Barcelona league or Champions League match.\n\n"
         "Here are your upcoming games for the week:\n"
-    )
+    ]
     if champions_games:
-        welcome += "\n**Champions League Matches:**\n" + "\n".join(champions_games) + "\n"
+        parts += ["\n**Champions League Matches:**\n", "\n".join(champions_games), "\n"]
     if league_games:
-        welcome += "\n**League Matches:**\n" + "\n".join(league_games) + "\n"
+        parts += ["\n**League Matches:**\n", "\n".join(league_games), "\n"]
     if not champions_games and not league_games:
-        welcome += "\nNo upcoming matches within the next week."
+        parts.append("\nNo upcoming matches within the next week.")
     
-    update.message.reply_text(welcome)
+    update.message.reply_text("".join(parts))
 
 def remove(update, context):
     """
@@ -246,65 +717,104 @@ def remove(update, context):
     remove_chat(chat_id)
     update.message.reply_text("You have been removed from FC Barcelona reminders. Send /start to register again.")
 
+def fetch_standings(url, title):
+    """
+    Fetches the overall (TOTAL) standings table from Football-Data.org and renders it
+    as a Markdown message headed by the given title.
+    Returns None if the response has no overall table; raises requests.RequestException
+    if the request fails. Rendered messages are cached for STANDINGS_CACHE_TTL seconds.
+    """
+    cached = _standings_cache.get(url)
+    if cached and time.monotonic() - cached[0] < STANDINGS_CACHE_TTL:
+        return cached[1]
+
+    response = _http.get(url, timeout=HTTP_TIMEOUT)
+    if response.status_code != 200:
+        logger.error("Error fetching standings: %s %s", response.status_code, response.text)
+        raise requests.HTTPError(f"Unexpected status {response.status_code}", response=response)
+    data = json_loads(response.content)
+    standings = None
+    for standing in data.get("standings", []):
+        if standing.get("type") == "TOTAL":
+            standings = standing.get("table", [])
+            break
+    if standings is None:
+        return None
+    lines = [f"*{title}:*"]
+    for team in standings:
+        position = team.get("position")
+        team_name = escape_markdown(team.get("team", {}).get("name", "Unknown"))
+        points = team.get("points")
+        lines.append(f"{position}. {team_name} - {points} pts")
+    message = "\n".join(lines)
+    _standings_cache[url] = (time.monotonic(), message)
+    return message
+
+def reply_standings(update, message):
+    """
+    Replies with a standings message rendered by fetch_standings.
+    """
+    update.message.reply_text(
+        message,
+        parse_mode=telegram.ParseMode.MARKDOWN,
+        disable_web_page_preview=True
+    )
+
 def league(update, context):
     """
     Handler for the /league command.
     Fetches and displays the current La Liga standings.
     """
-    headers = {"X-Auth-Token": FOOTBALL_API_KEY}
-    response = requests.get(LEAGUE_STANDINGS_URL, headers=headers)
-    if response.status_code == 200:
-        data = response.json()
-        standings = None
-        for standing in data.get("standings", []):
-            if standing.get("type") == "TOTAL":
-                standings = standing.get("table", [])
-                break
-        if standings is None:
-            update.message.reply_text("League standings not found.")
-            return
-        message = "La Liga Standings:\n"
-        for team in standings:
-            position = team.get("position")
-            team_name = team.get("team", {}).get("name", "Unknown")
-            points = team.get("points")
-            message += f"{position}. {team_name} - {points} pts\n"
-        update.message.reply_text(message)
-    else:
+    try:
+        message = fetch_standings(LEAGUE_STANDINGS_URL, "La Liga Standings")
+    except requests.RequestException:
         update.message.reply_text("Error fetching league standings.")
+        return
+    if message is None:
+        update.message.reply_text("League standings not found.")
+        return
+    reply_standings(update, message)
 
 def championsLeague(update, context):
     """
     Handler for the /championsLeague command.
     Fetches and displays the current Champions League standings.
     """
-    headers = {"X-Auth-Token": FOOTBALL_API_KEY}
-    response = requests.get(CHAMPIONS_LEAGUE_STANDINGS_URL, headers=headers)
-    if response.status_code == 200:
-        data = response.json()
-        standings = None
-        for standing in data.get("standings", []):
-            if standing.get("type") == "TOTAL":
-                standings = standing.get("table", [])
-                break
-        if standings is None:
-            update.message.reply_text("Champions League standings not found.")
-            return
-        message = "Champions League Standings:\n"
-        for team in standings:
-            position = team.get("position")
-            team_name = team.get("team", {}).get("name", "Unknown")
-            points = team.get("points")
-            message += f"{position}. {team_name} - {points} pts\n"
-        update.message.reply_text(message)
-    else:
+    try:
+        message = fetch_standings(CHAMPIONS_LEAGUE_STANDINGS_URL, "Champions League Standings")
+    except requests.RequestException:
         update.message.reply_text("Error fetching Champions League standings.")
+        return
+    if message is None:
+        update.message.reply_text("Champions League standings not found.")
+        return
+    reply_standings(update, message)
 
 @app.route(f'/{TELEGRAM_TOKEN}', methods=['POST'])
 def webhook():
-    """Handle incoming webhook updates from Telegram"""
-    update = telegram.Update.de_json(request.get_json(force=True), bot)
-    dispatcher.process_update(update)
+    """
+    Handle incoming webhook updates from Telegram.
+    An update that can't be decoded is acknowledged, since redelivering it won't help;
+    any other failure returns 500 so Telegram delivers the update again.
+    """
+    global _last_webhook_check
+    try:
+        update = telegram.Update.de_json(json_loads(request.get_data(cache=False)), bot)
+    except Exception:
+        logger.exception("Discarding undecodable webhook update")
+        return 'ok'
+    try:
+        dispatcher.process_update(update)
+    except Exception:
+        logger.exception("Error processing webhook update")
+        with _webhook_check_lock:
+            now = time.monotonic()
+            check_due = now - _last_webhook_check >= WEBHOOK_FAILURE_CHECK_COOLDOWN
+            if check_due:
+                _last_webhook_check = now
+        if check_due:
+            ensure_webhook()
+        return "Error processing update", 500
     return 'ok'
 
 @app.route('/')
@@ -320,22 +830,93 @@ def health_check():
         return "Webhook is healthy", 200
     return "Webhook is down", 503
 
+def create_scheduler():
+    """
+    Creates the background scheduler with SCHEDULER_WORKERS executor threads
+    instead of APScheduler's default of 10. Reminder jobs hand their broadcast to the
+    broadcaster thread and return at once; only the daily update and the webhook
+    check make API calls, so a few threads cover every job.
+    """
+    return BackgroundScheduler(
+        timezone="Asia/Jerusalem",
+        executors={"default": {"type": "threadpool", "max_workers": SCHEDULER_WORKERS}}
+    )
+
+def start_dispatcher():
+    """
+    Starts the dispatcher's update loop and its worker threads in the background.
+    Polling does this itself; with the webhook it must be started explicitly, or
+    run_async handlers are queued and never run.
+    """
+    ready = threading.Event()
+    threading.Thread(target=dispatcher.start, kwargs={"ready": ready}, name="dispatcher", daemon=True).start()
+    ready.wait()
+
+def setup_logging():
+    """
+    Configures logging for the running bot, at the level named by LOG_LEVEL (default
+    INFO; per-job and per-chat detail is DEBUG). Records go through a queue: callers
+    (scheduler jobs, send workers, handlers) only enqueue them, and a background
+    listener thread does the blocking write to stderr.
+    """
+    level_name = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    level = logging.getLevelName(level_name)
+    valid_level = isinstance(level, int)
+    if not valid_level:
+        level = logging.INFO
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    listener.start()
+    atexit.register(listener.stop)
+    logging.basicConfig(
+        level=level,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        handlers=[logging.handlers.QueueHandler(log_queue)]
+    )
+    if not valid_level:
+        logger.warning("Unknown LOG_LEVEL %r, logging at INFO.", level_name)
+
 def main():
     global bot, dispatcher
+    setup_logging()
+    # Only needed to run the bot, so importing this module (e.g. in tests) skips them
+    from telegram.ext import Updater, CommandHandler
+    from telegram.utils.request import Request
+    from waitress import serve
     
-    # Initialize bot and dispatcher
-    updater = Updater(TELEGRAM_TOKEN, use_context=True)
+    # Initialize bot and dispatcher. One HTTPS connection pool, sized for parallel
+    # reminder sends plus handler replies, is shared by everything that calls Telegram.
+    telegram_request = Request(
+        con_pool_size=TELEGRAM_POOL_SIZE,
+        connect_timeout=5,
+        read_timeout=10
+    )
+    updater = Updater(
+        bot=telegram.Bot(token=TELEGRAM_TOKEN, request=telegram_request),
+        workers=HANDLER_WORKERS,
+        use_context=True
+    )
     bot = updater.bot
     dispatcher = updater.dispatcher
     
-    # Add command handlers
-    dispatcher.add_handler(CommandHandler("start", start))
-    dispatcher.add_handler(CommandHandler("remove", remove))
-    dispatcher.add_handler(CommandHandler("league", league))
-    dispatcher.add_handler(CommandHandler("championsLeague", championsLeague))
+    # Add command handlers. They block on Football-Data.org and MongoDB, so run them
+    # on the dispatcher's worker threads; a slow API call then doesn't hold up other
+    # users' commands (or the webhook request that delivered the update).
+    dispatcher.add_handler(CommandHandler("start", start, run_async=True))
+    dispatcher.add_handler(CommandHandler("remove", remove, run_async=True))
+    dispatcher.add_handler(CommandHandler("league", league, run_async=True))
+    dispatcher.add_handler(CommandHandler("championsLeague", championsLeague, run_async=True))
+
+    # Establish the MongoDB connection up front instead of on the first /start
+    mongo_client.admin.command("ping")
+    create_indexes()
+    load_chat_ids()
+    threading.Thread(target=watch_chats, daemon=True).start()
+    # Runs before mongo_client.close (atexit handlers run in reverse order)
+    atexit.register(flush_chat_writes)
 
     # Initialize and start the scheduler
-    scheduler = BackgroundScheduler(timezone="Asia/Jerusalem")
+    scheduler = create_scheduler()
     scheduler.start()
     schedule_reminders(bot, scheduler)
     scheduler.add_job(
@@ -349,31 +930,42 @@ def main():
 
     if os.environ.get('DEVELOPMENT'):
         # In development mode, delete the webhook first and then use polling.
-        print("Running in development mode: deleting webhook and using polling.")
+        logger.info("Running in development mode: deleting webhook and using polling.")
         try:
             bot.delete_webhook()
             # Wait briefly to ensure deletion propagates
             time.sleep(1)
         except Exception as e:
-            print("Error deleting webhook:", e)
+            logger.error("Error deleting webhook: %s", e)
         try:
-            updater.start_polling()
+            # Long-poll: Telegram holds each getUpdates call open until an update
+            # arrives (or the timeout expires), so an idle bot makes ~2 calls/minute.
+            updater.start_polling(timeout=POLL_TIMEOUT)
             updater.idle()
         except KeyboardInterrupt:
-            print("Exiting development mode, restoring webhook...")
+            logger.info("Exiting development mode, restoring webhook...")
             restore_webhook()
     else:
         # In production mode, assume Render is active and use the webhook.
-        monitor_thread = threading.Thread(target=webhook_monitor, daemon=True)
-        monitor_thread.start()
-        webhook_url = os.environ.get('WEBHOOK_URL')
-        if webhook_url:
-            full_webhook_url = f"{webhook_url}/{TELEGRAM_TOKEN}"
-            bot.set_webhook(full_webhook_url)
-            print(f"Webhook set to: {full_webhook_url}")
-            app.run(host='0.0.0.0', port=PORT)
+        # The webhook is registered once here; it is re-checked when an update fails
+        # and, as a safety net, once an hour on Render.
+        if ON_RENDER:
+            scheduler.add_job(
+                ensure_webhook,
+                'interval',
+                hours=WEBHOOK_SAFETY_CHECK_HOURS,
+                id="webhook_health"
+            )
+        if WEBHOOK_URL:
+            full_webhook_url = f"{WEBHOOK_URL}/{TELEGRAM_TOKEN}"
+            set_webhook(full_webhook_url)
+            logger.info("Webhook set to: %s", redact_token(full_webhook_url))
+            start_dispatcher()
+            # Serve with waitress's thread pool rather than Flask's development server,
+            # so health probes and webhook POSTs don't queue behind each other.
+            serve(app, host='0.0.0.0', port=PORT, threads=WSGI_THREADS, connection_limit=WSGI_CONNECTION_LIMIT)
         else:
-            print("Error: WEBHOOK_URL environment variable not set")
+            logger.error("WEBHOOK_URL environment variable not set")
 
 if __name__ == '__main__':
     main()
@@ -1,19 +1,42 @@
 # imghdr.py
-from PIL import Image
+
+import logging
+
+logger = logging.getLogger(__name__)
 
 def what(filename, h=None):
     """
-    Open an image file using Pillow and return a string representing its format.
-    If the image cannot be opened or its format is not recognized, return None.
+    Recognize the type of an image from its leading bytes and return a string
+    representing its format ('png', 'jpeg', 'gif', 'webp', 'bmp' or 'tiff').
+    If h is given, it is used instead of reading from filename (a path or a file object).
+    If the format is not recognized, or there is nothing to read, return None.
     """
     try:
-        with Image.open(filename) as img:
-            fmt = img.format.lower()
-            # Map 'jpeg' as needed (Pillow returns 'jpeg' for JPEG images)
-            return fmt
-    except Exception as e:
-        print(f"imghdr error: {e}")
+        if h is None:
+            if hasattr(filename, "read"):
+                position = filename.tell()
+                h = filename.read(32)
+                filename.seek(position)
+            else:
+                with open(filename, "rb") as f:
+                    h = f.read(32)
+    except (OSError, TypeError) as e:
+        logger.debug("imghdr could not read %r: %s", filename, e)
         return None
 
+    if h.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if h[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if h[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if h[:4] == b"RIFF" and h[8:12] == b"WEBP":
+        return "webp"
+    if h.startswith(b"BM"):
+        return "bmp"
+    if h[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return None
+
 # Optionally, you can define a tests dictionary if needed by consumers.
 tests = {}
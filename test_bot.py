@@ -5,19 +5,34 @@ This test suite covers the main functionality of the FC Barcelona Reminder Bot.
 It tests:
   - The get_opponent function (determining the opponent's name).
   - The fetch_game_schedule function using a mocked HTTP response.
+  - The fetch_game_schedule cache (TTL short-circuit and HTTP 304 revalidation).
   - The schedule_reminders function to ensure correct scheduling of jobs.
-  - The update_schedule function to verify it clears and re-adds jobs.
-  - The register_chat function to check persistent registration.
+  - The update_schedule function to verify it only adds and removes changed reminder jobs.
+  - The send_reminder function to verify every registered chat is messaged.
+  - The send rate limiter (token bucket) used by the reminder fan-out.
+  - The register_chat and remove_chat functions to check batched persistent registration.
+  - The in-process chat ID cache kept in sync by registration, removal and the change stream.
+  - The /league command handler and the standings cache.
   - The /start command handler to ensure it registers a chat and replies with a welcome message.
-  - The Flask server endpoint to confirm that the web server is running.
+  - The Flask server endpoints: the index page, webhook dispatch (including to a real,
+    started dispatcher) and failure recovery.
 
 These tests are written using Python's unittest framework.
 """
 
+import copy
+import json
+import logging
+import requests
+import threading
+import time
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, PropertyMock
 import datetime
-import pytz
+from pymongo import UpdateOne, DeleteOne
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+
+import bot
 
 # Import functions and objects from the bot module.
 from bot import (
@@ -25,8 +40,11 @@ from bot import (
     fetch_game_schedule,
     schedule_reminders,
     update_schedule,
+    send_reminder,
     register_chat,
+    remove_chat,
     start,
+    league,
     israel_tz,
     app  # Flask app
 )
@@ -35,6 +53,27 @@ from bot import (
 from apscheduler.schedulers.background import BackgroundScheduler
 
 class TestBotFunctions(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # One scheduler for every scheduler test. It is never started: jobs stay
+        # in memory, nothing fires and there is no thread to shut down.
+        cls.scheduler = BackgroundScheduler(timezone="Asia/Jerusalem")
+        # A match 12 hours ahead, built once for the scheduling and /start tests
+        cls._future_12h = datetime.datetime.now(israel_tz) + datetime.timedelta(hours=12)
+        cls._utc_iso_12h = cls._future_12h.astimezone(datetime.timezone.utc).isoformat().replace("+00:00", "Z")
+        cls._fake_match_12h = {
+            "utcDate": cls._utc_iso_12h,
+            "homeTeam": {"id": 81, "name": "FC Barcelona"},
+            "awayTeam": {"id": 100, "name": "Real Madrid"},
+            "localDate": cls._future_12h
+        }
+
+    def setUp(self):
+        # Start every test with empty match schedule and standings caches
+        bot._sched_cache.update(etag=None, last_modified=None, matches=[], params=None, fetched=0)
+        bot._standings_cache.clear()
+        bot._chat_ids = None
+
     def test_get_opponent_home(self):
         """
         Test get_opponent when FC Barcelona (id 81) is the home team.
@@ -59,16 +98,23 @@ class TestBotFunctions(unittest.TestCase):
         opponent = get_opponent(match)
         self.assertEqual(opponent, "Real Madrid")
     
-    @patch('bot.requests.get')
+    def test_get_opponent_missing_team(self):
+        """
+        Test get_opponent when the team data is missing (e.g. a to-be-decided fixture).
+        """
+        self.assertEqual(get_opponent({"homeTeam": {"id": 81}}), "Unknown Opponent")
+    
+    @patch('bot._http.get')
     def test_fetch_game_schedule(self, mock_get):
         """
-        Test fetch_game_schedule by mocking requests.get.
+        Test fetch_game_schedule by mocking the shared HTTP session's get.
         It should return matches with a 'localDate' field converted to Israel timezone.
         """
         fake_response = {
             "matches": [
                 {
                     "utcDate": "2025-02-22T19:00:00Z",
+                    "competition": {"name": "UEFA Champions League"},
                     "homeTeam": {"id": 81, "name": "FC Barcelona"},
                     "awayTeam": {"id": 100, "name": "Real Madrid"}
                 }
@@ -76,7 +122,8 @@ class TestBotFunctions(unittest.TestCase):
         }
         mock_resp = MagicMock()
         mock_resp.status_code = 200
-        mock_resp.json.return_value = fake_response
+        mock_resp.headers = {}
+        mock_resp.content = json.dumps(fake_response).encode()
         mock_get.return_value = mock_resp
         
         matches = fetch_game_schedule()
@@ -84,93 +131,482 @@ class TestBotFunctions(unittest.TestCase):
         self.assertIn("localDate", matches[0])
         self.assertTrue(isinstance(matches[0]["localDate"], datetime.datetime))
         # Compare timezone names rather than tzinfo objects
-        self.assertEqual(matches[0]["localDate"].tzinfo.zone, israel_tz.zone)
+        self.assertEqual(matches[0]["localDate"].tzinfo.key, israel_tz.key)
+        self.assertEqual(matches[0]["compKind"], "champions")
+        # The request is limited to a date window starting today
+        params = mock_get.call_args[1]["params"]
+        self.assertEqual(params["dateFrom"], datetime.datetime.now(israel_tz).date().isoformat())
+        self.assertIn("dateTo", params)
+    
+    @patch('bot._http.get')
+    def test_fetch_game_schedule_errors(self, mock_get):
+        """
+        Test that a failed request or an invalid response body returns the last
+        fetched schedule instead of raising.
+        """
+        bot._sched_cache["matches"] = [{"utcDate": "2025-02-22T19:00:00Z"}]
+        mock_get.side_effect = requests.ConnectionError("unreachable")
+        self.assertEqual(fetch_game_schedule(), bot._sched_cache["matches"])
+        
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.content = b"<html>"
+        mock_get.side_effect = None
+        mock_get.return_value = mock_resp
+        self.assertEqual(fetch_game_schedule(), bot._sched_cache["matches"])
+    
+    @patch('bot._http.get')
+    def test_fetch_game_schedule_sorted(self, mock_get):
+        """
+        Test that fetch_game_schedule returns matches in kick-off order.
+        """
+        fake_response = {
+            "matches": [
+                {"utcDate": "2025-03-01T19:00:00Z", "homeTeam": {"id": 81}, "awayTeam": {"id": 90, "name": "Sevilla"}},
+                {"utcDate": "2025-02-22T19:00:00Z", "homeTeam": {"id": 81}, "awayTeam": {"id": 100, "name": "Real Madrid"}}
+            ]
+        }
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.headers = {}
+        mock_resp.content = json.dumps(fake_response).encode()
+        mock_get.return_value = mock_resp
+        
+        matches = fetch_game_schedule()
+        self.assertEqual([get_opponent(m) for m in matches], ["Real Madrid", "Sevilla"])
+    
+    @patch('bot._http.get')
+    def test_fetch_game_schedule_cached(self, mock_get):
+        """
+        Test that fetch_game_schedule serves repeated calls from its cache:
+        within the TTL no request is made, and after it a 304 reuses the cached list.
+        """
+        fake_response = {
+            "matches": [
+                {
+                    "utcDate": "2025-02-22T19:00:00Z",
+                    "homeTeam": {"id": 81, "name": "FC Barcelona"},
+                    "awayTeam": {"id": 100, "name": "Real Madrid"}
+                }
+            ]
+        }
+        ok_resp = MagicMock()
+        ok_resp.status_code = 200
+        ok_resp.headers = {"ETag": '"abc"'}
+        ok_resp.content = json.dumps(fake_response).encode()
+        mock_get.return_value = ok_resp
+        
+        matches = fetch_game_schedule()
+        # A second call within the TTL must not hit the API
+        self.assertIs(fetch_game_schedule(), matches)
+        self.assertEqual(mock_get.call_count, 1)
+        
+        # Once the TTL has expired, a 304 response returns the cached list
+        bot._sched_cache["fetched"] -= bot.SCHEDULE_CACHE_TTL
+        not_modified = MagicMock()
+        not_modified.status_code = 304
+        mock_get.return_value = not_modified
+        self.assertIs(fetch_game_schedule(), matches)
+        sent_headers = mock_get.call_args[1]["headers"]
+        self.assertEqual(sent_headers["If-None-Match"], '"abc"')
+        self.assertEqual(mock_get.call_count, 2)
     
     @patch('bot.fetch_game_schedule')
     def test_schedule_reminders(self, mock_fetch):
         """
         Test that schedule_reminders schedules 3 jobs for a match 12 hours in the future.
         """
-        future_time = datetime.datetime.now(israel_tz) + datetime.timedelta(hours=12)
-        fake_match = {
-            "utcDate": future_time.astimezone(datetime.timezone.utc).isoformat().replace("+00:00", "Z"),
-            "homeTeam": {"id": 81, "name": "FC Barcelona"},
-            "awayTeam": {"id": 100, "name": "Real Madrid"},
-            "localDate": future_time
-        }
-        mock_fetch.return_value = [fake_match]
+        mock_fetch.return_value = [copy.copy(self._fake_match_12h)]
         
         dummy_bot = MagicMock()
-        scheduler = BackgroundScheduler(timezone="Asia/Jerusalem")
-        scheduler.start()
-        scheduler.remove_all_jobs()  # Clear any pre-existing jobs
+        scheduler = self.scheduler
+        scheduler.remove_all_jobs()
         
         schedule_reminders(dummy_bot, scheduler)
         jobs = scheduler.get_jobs()
         # For a match 12 hours in future with reminders at 7,5,2 hours, we expect 3 jobs.
         self.assertEqual(len(jobs), 3)
-        scheduler.shutdown()
+        # The reminder text is formatted when scheduling, not when the job fires.
+        self.assertIn("match against Real Madrid", jobs[0].args[1])
     
     @patch('bot.fetch_game_schedule')
     def test_update_schedule(self, mock_fetch):
         """
-        Test that update_schedule clears existing jobs and re-adds them.
+        Test that update_schedule keeps the reminder jobs of an unchanged schedule.
         """
-        future_time = datetime.datetime.now(israel_tz) + datetime.timedelta(hours=12)
-        fake_match = {
-            "utcDate": future_time.astimezone(datetime.timezone.utc).isoformat().replace("+00:00", "Z"),
-            "homeTeam": {"id": 81, "name": "FC Barcelona"},
-            "awayTeam": {"id": 100, "name": "Real Madrid"},
-            "localDate": future_time
-        }
-        mock_fetch.return_value = [fake_match]
+        mock_fetch.return_value = [copy.copy(self._fake_match_12h)]
         
         dummy_bot = MagicMock()
-        scheduler = BackgroundScheduler(timezone="Asia/Jerusalem")
-        scheduler.start()
+        scheduler = self.scheduler
+        scheduler.remove_all_jobs()
         
         # First, schedule some jobs
         schedule_reminders(dummy_bot, scheduler)
         initial_jobs = scheduler.get_jobs()
         self.assertEqual(len(initial_jobs), 3)
         
-        # Now, update schedule, which should remove existing jobs and re-add new ones.
+        # Now, update schedule, which should leave the existing jobs in place.
+        bot._sched_cache["fetched"] = time.monotonic()
         update_schedule(dummy_bot, scheduler)
         updated_jobs = scheduler.get_jobs()
         # We expect 3 jobs again.
         self.assertEqual(len(updated_jobs), 3)
+        # The daily update invalidates the schedule cache's TTL.
+        self.assertEqual(bot._sched_cache["fetched"], 0)
+    
+    @patch('bot.fetch_game_schedule')
+    def test_update_schedule_removes_stale_reminders(self, mock_fetch):
+        """
+        Test that update_schedule drops reminders for matches that left the schedule
+        and only adds reminders for new matches.
+        """
+        first_time = self._future_12h
+        second_time = first_time + datetime.timedelta(days=3)
+        def fake_match(game_time):
+            return {
+                "homeTeam": {"id": 81, "name": "FC Barcelona"},
+                "awayTeam": {"id": 100, "name": "Real Madrid"},
+                "localDate": game_time
+            }
+        mock_fetch.return_value = [fake_match(first_time)]
+        
+        dummy_bot = MagicMock()
+        scheduler = self.scheduler
+        scheduler.remove_all_jobs()
+        schedule_reminders(dummy_bot, scheduler)
+        
+        # The first match is rescheduled away; a new match appears.
+        mock_fetch.return_value = [fake_match(second_time)]
+        with patch.object(scheduler, 'add_job', wraps=scheduler.add_job) as add_job:
+            update_schedule(dummy_bot, scheduler)
+        job_ids = {job.id for job in scheduler.get_jobs()}
+        self.assertEqual(len(job_ids), 3)
+        self.assertTrue(all(second_time.isoformat() in job_id for job_id in job_ids))
+        self.assertEqual(add_job.call_count, 3)
+        
+        # Running again with an unchanged schedule adds nothing.
+        with patch.object(scheduler, 'add_job', wraps=scheduler.add_job) as add_job:
+            update_schedule(dummy_bot, scheduler)
+        add_job.assert_not_called()
+        self.assertEqual({job.id for job in scheduler.get_jobs()}, job_ids)
+    
+    @patch('bot._http.get')
+    def test_update_schedule_keeps_reminders_when_fetch_fails(self, mock_get):
+        """
+        Test that an API error during the daily update keeps the existing reminders
+        instead of treating the failed request as an empty schedule.
+        """
+        ok_resp = MagicMock()
+        ok_resp.status_code = 200
+        ok_resp.headers = {}
+        ok_resp.content = json.dumps({"matches": [
+            {k: v for k, v in self._fake_match_12h.items() if k != "localDate"}
+        ]}).encode()
+        error_resp = MagicMock()
+        error_resp.status_code = 500
+        mock_get.side_effect = [ok_resp, error_resp]
+        
+        dummy_bot = MagicMock()
+        scheduler = self.scheduler
+        scheduler.remove_all_jobs()
+        schedule_reminders(dummy_bot, scheduler)
+        job_ids = {job.id for job in scheduler.get_jobs()}
+        self.assertEqual(len(job_ids), 3)
+        
+        update_schedule(dummy_bot, scheduler)
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual({job.id for job in scheduler.get_jobs()}, job_ids)
+    
+    @patch('bot.fetch_game_schedule')
+    def test_update_schedule_keeps_service_jobs(self, mock_fetch):
+        """
+        Test that update_schedule leaves the daily update and webhook health jobs in place.
+        """
+        mock_fetch.return_value = []
+        
+        dummy_bot = MagicMock()
+        scheduler = self.scheduler
+        scheduler.remove_all_jobs()
+        scheduler.add_job(update_schedule, 'cron', hour=0, minute=0,
+                          args=[dummy_bot, scheduler], id="daily_update")
+        scheduler.add_job(MagicMock(), 'interval', minutes=5, id="webhook_health")
+        
+        update_schedule(dummy_bot, scheduler)
+        job_ids = {job.id for job in scheduler.get_jobs()}
+        self.assertEqual(job_ids, {"daily_update", "webhook_health"})
+    
+    @patch('bot.time.sleep')
+    @patch('bot.chats_collection')
+    def test_send_reminder(self, mock_collection, mock_sleep):
+        """
+        Test that send_reminder messages every registered chat and keeps going
+        when a single chat fails.
+        """
+        mock_collection.find.return_value.batch_size.return_value = [
+            {"chat_id": 1}, {"chat_id": 2}, {"chat_id": 3}
+        ]
+        dummy_bot = MagicMock()
+        dummy_bot.send_message.side_effect = [None, Exception("blocked"), None]
+        message = "Reminder: FC Barcelona Home match against Real Madrid in 7 hours!"
+        
+        send_reminder(dummy_bot, message).result(timeout=5)
         
-        scheduler.shutdown()
+        sent_to = sorted(c[1]["chat_id"] for c in dummy_bot.send_message.call_args_list)
+        self.assertEqual(sent_to, [1, 2, 3])
+        for call in dummy_bot.send_message.call_args_list:
+            self.assertEqual(call[1]["text"], message)
+    
+    def test_wait_for_send_slot_throttles_after_burst(self):
+        """
+        Test that the send rate limiter lets a full bucket through immediately
+        and only waits once the tokens are used up.
+        """
+        # Simulated clock for this thread: sleeping advances it instead of blocking.
+        # (time is patched module-wide, so other threads keep the real functions.)
+        clock = [0.0]
+        sleeps = []
+        real_sleep, real_monotonic = time.sleep, time.monotonic
+        test_thread = threading.current_thread()
+        def fake_monotonic():
+            return clock[0] if threading.current_thread() is test_thread else real_monotonic()
+        def fake_sleep(seconds):
+            if threading.current_thread() is not test_thread:
+                return real_sleep(seconds)
+            sleeps.append(seconds)
+            clock[0] += seconds
+        with patch('bot.time.monotonic', side_effect=fake_monotonic), \
+                patch('bot.time.sleep', side_effect=fake_sleep):
+            bot._send_tokens = float(bot.SEND_RATE_LIMIT)
+            bot._tokens_updated_at = clock[0]
+            for _ in range(bot.SEND_RATE_LIMIT):
+                bot.wait_for_send_slot()
+            self.assertEqual(sleeps, [])
+            
+            # The bucket is empty: the next caller waits for one token to refill.
+            bot.wait_for_send_slot()
+            self.assertEqual(len(sleeps), 1)
+            self.assertAlmostEqual(clock[0], 1.0 / bot.SEND_RATE_LIMIT)
     
     @patch('bot.chats_collection')
     def test_register_chat_new(self, mock_collection):
         """
-        Test register_chat to ensure a new chat ID is inserted if not already registered.
+        Test register_chat to ensure a new chat ID is saved via a batched upsert.
         """
-        # Simulate that find_one returns None (chat not registered)
-        mock_collection.find_one.return_value = None
+        # Simulate that no chats are registered yet
+        mock_collection.find.return_value.batch_size.return_value = []
         
         # Call register_chat with a dummy chat id
         dummy_chat_id = 123456
         from bot import register_chat
         register_chat(dummy_chat_id)
-        # Check that insert_one was called with the dummy chat id.
-        mock_collection.insert_one.assert_called_with({"chat_id": dummy_chat_id})
+        bot.flush_chat_writes()
+        # Check that one bulk write upserted the dummy chat id without a prior lookup.
+        mock_collection.bulk_write.assert_called_once_with(
+            [UpdateOne({"chat_id": dummy_chat_id}, {"$setOnInsert": {"chat_id": dummy_chat_id}}, upsert=True)],
+            ordered=False
+        )
+        mock_collection.find_one.assert_not_called()
     
     @patch('bot.chats_collection')
     def test_register_chat_existing(self, mock_collection):
         """
         Test register_chat to ensure it does not insert a chat ID that is already registered.
         """
-        # Simulate that find_one returns a document (chat already registered)
-        mock_collection.find_one.return_value = {"chat_id": 123456}
+        # Simulate that the chat is already registered
+        mock_collection.find.return_value.batch_size.return_value = [{"chat_id": 123456}]
         
         dummy_chat_id = 123456
         from bot import register_chat
         register_chat(dummy_chat_id)
-        # insert_one should not be called since chat is already registered.
+        bot.flush_chat_writes()
+        # Only the idempotent upsert is issued; no plain insert.
+        mock_collection.bulk_write.assert_called_once()
         mock_collection.insert_one.assert_not_called()
     
+    @patch('bot.chats_collection')
+    def test_remove_chat(self, mock_collection):
+        """
+        Test remove_chat to ensure it deletes the chat ID in a single operation.
+        """
+        mock_collection.find.return_value.batch_size.return_value = [{"chat_id": 123456}]
+        
+        dummy_chat_id = 123456
+        remove_chat(dummy_chat_id)
+        bot.flush_chat_writes()
+        mock_collection.bulk_write.assert_called_once_with(
+            [DeleteOne({"chat_id": dummy_chat_id})], ordered=False
+        )
+        mock_collection.find_one.assert_not_called()
+    
+    @patch('bot.chats_collection')
+    def test_create_indexes_removes_duplicates(self, mock_collection):
+        """
+        Test that duplicate chat IDs blocking the unique index are removed, keeping
+        one document per chat, before the index is created again.
+        """
+        mock_collection.create_index.side_effect = [DuplicateKeyError("E11000"), None]
+        mock_collection.aggregate.return_value = [{"_id": 1, "ids": ["a", "b", "c"], "count": 3}]
+        
+        bot.create_indexes()
+        mock_collection.delete_many.assert_called_once_with({"_id": {"$in": ["b", "c"]}})
+        self.assertEqual(mock_collection.create_index.call_count, 2)
+    
+    @patch('bot.chats_collection')
+    def test_chat_writes_are_batched(self, mock_collection):
+        """
+        Test that writes queued close together are sent in one bulk write,
+        keeping only the latest operation per chat.
+        """
+        mock_collection.find.return_value.batch_size.return_value = []
+        
+        register_chat(1)
+        register_chat(2)
+        remove_chat(1)
+        bot.flush_chat_writes()
+        mock_collection.bulk_write.assert_called_once_with(
+            [
+                DeleteOne({"chat_id": 1}),
+                UpdateOne({"chat_id": 2}, {"$setOnInsert": {"chat_id": 2}}, upsert=True)
+            ],
+            ordered=False
+        )
+    
+    @patch('bot.chats_collection')
+    def test_failed_chat_writes_are_retried(self, mock_collection):
+        """
+        Test that a failed bulk write queues its operations again, without
+        overriding newer operations for the same chats.
+        """
+        mock_collection.find.return_value.batch_size.return_value = []
+        mock_collection.bulk_write.side_effect = [PyMongoError("boom"), None]
+        
+        register_chat(1)
+        register_chat(2)
+        bot.flush_chat_writes()
+        remove_chat(2)
+        bot.flush_chat_writes()
+        self.assertEqual(mock_collection.bulk_write.call_count, 2)
+        mock_collection.bulk_write.assert_called_with(
+            [
+                UpdateOne({"chat_id": 1}, {"$setOnInsert": {"chat_id": 1}}, upsert=True),
+                DeleteOne({"chat_id": 2})
+            ],
+            ordered=False
+        )
+        self.assertEqual(bot._pending_chat_writes, {})
+    
+    @patch('bot.chats_collection')
+    def test_chat_ids_cache(self, mock_collection):
+        """
+        Test that chat IDs are loaded from MongoDB once and then kept up to date
+        by register_chat and remove_chat without further queries.
+        """
+        mock_collection.find.return_value.batch_size.return_value = [{"chat_id": 1}, {"chat_id": 2}]
+        
+        self.assertEqual(sorted(bot.get_chat_ids()), [1, 2])
+        register_chat(3)
+        remove_chat(1)
+        bot.flush_chat_writes()
+        self.assertEqual(sorted(bot.get_chat_ids()), [2, 3])
+        mock_collection.find.assert_called_once()
+    
+    @patch('bot.time.sleep')
+    @patch('bot.chats_collection')
+    def test_watch_chats(self, mock_collection, mock_sleep):
+        """
+        Test that the change stream watcher adds inserted chats to the cache directly,
+        reloads once per burst of deletes, retries transient errors and stops when
+        change streams are unsupported.
+        """
+        mock_collection.find.return_value.batch_size.side_effect = [
+            [{"chat_id": 1}, {"chat_id": 2}],  # initial load
+            [{"chat_id": 1}, {"chat_id": 2}],  # reload after the transient error
+            [{"chat_id": 2}, {"chat_id": 3}],  # reload after the deletes
+        ]
+        stream = MagicMock()
+        type(stream).alive = PropertyMock(side_effect=[True, False])
+        stream.next.return_value = {"operationType": "insert", "fullDocument": {"chat_id": 3}}
+        stream.try_next.side_effect = [{"operationType": "delete"}, {"operationType": "delete"}, None]
+        watch = MagicMock()
+        watch.__enter__.return_value = stream
+        mock_collection.watch.side_effect = [
+            OperationFailure("interrupted", code=11600),
+            watch,
+            OperationFailure("not supported", code=40573),
+        ]
+        
+        bot.get_chat_ids()
+        bot.watch_chats()
+        self.assertEqual(sorted(bot.get_chat_ids()), [2, 3])
+        self.assertEqual(mock_collection.watch.call_count, 3)
+        self.assertEqual(mock_collection.find.call_count, 3)
+    
+    @patch('bot._http.get')
+    def test_league_command_cached(self, mock_get):
+        """
+        Test the /league command handler.
+        It should reply with the formatted table and serve a repeat request from the cache.
+        """
+        fake_response = {
+            "standings": [
+                {
+                    "type": "TOTAL",
+                    "table": [
+                        {"position": 1, "team": {"name": "FC Barcelona"}, "points": 50},
+                        {"position": 2, "team": {"name": "Real Madrid"}, "points": 45}
+                    ]
+                }
+            ]
+        }
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.content = json.dumps(fake_response).encode()
+        mock_get.return_value = mock_resp
+        fake_update = MagicMock()
+        
+        league(fake_update, None)
+        league(fake_update, None)
+        
+        reply = fake_update.message.reply_text.call_args[0][0]
+        self.assertIn("1. FC Barcelona - 50 pts", reply)
+        self.assertTrue(reply.startswith("*La Liga Standings:*"))
+        self.assertTrue(fake_update.message.reply_text.call_args[1]["disable_web_page_preview"])
+        self.assertEqual(fake_update.message.reply_text.call_count, 2)
+        mock_get.assert_called_once()
+    
+    @patch('bot._http.get')
+    def test_league_command_error(self, mock_get):
+        """
+        Test that the /league command reports an error when the API request fails.
+        """
+        mock_resp = MagicMock()
+        mock_resp.status_code = 500
+        mock_get.return_value = mock_resp
+        fake_update = MagicMock()
+        
+        league(fake_update, None)
+        fake_update.message.reply_text.assert_called_with("Error fetching league standings.")
+    
+    @patch('bot.atexit.register')
+    @patch('bot.logging.handlers.QueueListener')
+    @patch('bot.logging.basicConfig')
+    def test_setup_logging_invalid_level(self, mock_basic_config, mock_listener, mock_register):
+        """
+        Test that an unknown LOG_LEVEL falls back to INFO instead of raising.
+        """
+        with patch.dict('os.environ', {"LOG_LEVEL": "verbose"}):
+            bot.setup_logging()
+        self.assertEqual(mock_basic_config.call_args[1]["level"], logging.INFO)
+        mock_listener.return_value.start.assert_called_once()
+    
+    @patch('bot.TELEGRAM_TOKEN', '123:secret')
+    def test_redact_token(self):
+        """
+        Test that the bot token is removed from webhook URLs before they are logged.
+        """
+        self.assertEqual(bot.redact_token("https://example.com/123:secret"), "https://example.com/<token>")
+        self.assertIsNone(bot.redact_token(None))
+    
     def test_flask_index(self):
         """
         Test the Flask server's index endpoint to ensure it returns the expected message.
@@ -181,6 +617,79 @@ class TestBotFunctions(unittest.TestCase):
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.data.decode('utf-8'), "FC Barcelona Reminder Bot is running!")
     
+    @patch('bot.dispatcher', create=True)
+    @patch('bot.bot', create=True)
+    def test_flask_webhook_dispatches_update(self, mock_bot, mock_dispatcher):
+        """
+        Test that the webhook endpoint decodes the update and hands it to the dispatcher.
+        """
+        with app.test_client() as client:
+            response = client.post(f"/{bot.TELEGRAM_TOKEN}", data=b'{"update_id": 42}')
+            self.assertEqual(response.status_code, 200)
+        update = mock_dispatcher.process_update.call_args[0][0]
+        self.assertEqual(update.update_id, 42)
+    
+    @patch('bot.bot', create=True)
+    def test_flask_webhook_runs_async_handlers(self, mock_bot):
+        """
+        Test that a webhook update reaches a run_async command handler on a real,
+        started dispatcher.
+        """
+        from queue import Queue
+        from telegram.ext import CommandHandler, Dispatcher
+        handled = threading.Event()
+        dispatcher = Dispatcher(mock_bot, Queue(), workers=2)
+        dispatcher.add_handler(CommandHandler("start", lambda update, context: handled.set(), run_async=True))
+        update = {
+            "update_id": 7,
+            "message": {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": 78910, "type": "private"},
+                "text": "/start",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 6}]
+            }
+        }
+        with patch('bot.dispatcher', dispatcher, create=True):
+            bot.start_dispatcher()
+            try:
+                with app.test_client() as client:
+                    response = client.post(f"/{bot.TELEGRAM_TOKEN}", json=update)
+                    self.assertEqual(response.status_code, 200)
+                self.assertTrue(handled.wait(5))
+            finally:
+                dispatcher.stop()
+    
+    @patch('bot.ensure_webhook')
+    @patch('bot.dispatcher', create=True)
+    @patch('bot.bot', create=True)
+    def test_flask_webhook_failure_checks_webhook(self, mock_bot, mock_dispatcher, mock_ensure):
+        """
+        Test that a failure while processing a webhook update returns 500 so Telegram
+        redelivers it, and triggers a (rate-limited) webhook check.
+        """
+        bot._last_webhook_check = 0.0
+        mock_dispatcher.process_update.side_effect = Exception("boom")
+        with app.test_client() as client:
+            response = client.post(f"/{bot.TELEGRAM_TOKEN}", json={"update_id": 1})
+            self.assertEqual(response.status_code, 500)
+            # A second failure within the cooldown does not check again.
+            client.post(f"/{bot.TELEGRAM_TOKEN}", json={"update_id": 2})
+        mock_ensure.assert_called_once()
+    
+    @patch('bot.ensure_webhook')
+    @patch('bot.dispatcher', create=True)
+    @patch('bot.bot', create=True)
+    def test_flask_webhook_undecodable_update(self, mock_bot, mock_dispatcher, mock_ensure):
+        """
+        Test that an update that can't be decoded is acknowledged and not dispatched.
+        """
+        with app.test_client() as client:
+            response = client.post(f"/{bot.TELEGRAM_TOKEN}", data=b'not json')
+            self.assertEqual(response.status_code, 200)
+        mock_dispatcher.process_update.assert_not_called()
+        mock_ensure.assert_not_called()
+    
     @patch('bot.register_chat')
     @patch('bot.fetch_game_schedule')
     def test_start_command(self, mock_fetch, mock_register):
@@ -195,15 +704,8 @@ class TestBotFunctions(unittest.TestCase):
         fake_update.message.chat.id = dummy_chat_id
         fake_update.message.reply_text = MagicMock()
         
-        # Prepare fake match schedule: one match 1 day in the future
-        future_time = datetime.datetime.now(israel_tz) + datetime.timedelta(days=1)
-        fake_match = {
-            "utcDate": future_time.astimezone(datetime.timezone.utc).isoformat().replace("+00:00", "Z"),
-            "competition": {"name": "La Liga"},
-            "homeTeam": {"id": 81, "name": "FC Barcelona"},
-            "awayTeam": {"id": 100, "name": "Real Madrid"},
-            "localDate": future_time
-        }
+        # Prepare fake match schedule: one league match 12 hours in the future
+        fake_match = dict(self._fake_match_12h, competition={"name": "La Liga"}, compKind="league")
         mock_fetch.return_value = [fake_match]
         
         from bot import start
@@ -213,6 +715,10 @@ class TestBotFunctions(unittest.TestCase):
         mock_register.assert_called_with(dummy_chat_id)
         # Check that reply_text was called (with a welcome message)
         fake_update.message.reply_text.assert_called()
+        welcome = fake_update.message.reply_text.call_args[0][0]
+        self.assertIn("**League Matches:**", welcome)
+        self.assertIn("vs Real Madrid (Home)", welcome)
+        self.assertNotIn("Champions League Matches", welcome)
     
 if __name__ == '__main__':
     unittest.main()